@@ -5,6 +5,7 @@ Tools for Claude to interact with the memory system
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import re
 import os
@@ -98,7 +99,13 @@ def denormalize_entity(entity: str) -> str:
 class MemoryClient:
     """Client for interacting with memory API"""
     
-    def __init__(self, api_url: str = "http://127.0.0.1:8001"):
+    def __init__(self, api_url: str = "http://127.0.0.1:8001", in_process: bool = False):
+        """
+        Args:
+            api_url: Base URL of the memory API server
+            in_process: Call the memory API module directly instead of over
+                HTTP. Use when the API runs in the same process.
+        """
         self.api_url = api_url
         self.logger = get_logger('claude_memory_client')
         
@@ -113,42 +120,85 @@ class MemoryClient:
         self.access_token = Config.generate_secure_token(current_dir)
         self.headers = {"X-Memory-Token": self.access_token}
         
+        # Reuse keep-alive connections to the API instead of reconnecting per call
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        
+        # In-process mode skips the loopback HTTP round trip entirely
+        self._api = None
+        if in_process:
+            import memory_api
+            if memory_api.memory_system is None and memory_api.init_memory_system() is None:
+                raise RuntimeError("Failed to initialize in-process memory system")
+            self._api = memory_api
+    
+    def _post(self, endpoint: str, payload: Dict):
+        """
+        Send a payload to an API endpoint
+        
+        Returns:
+            Tuple of (status code, parsed body or None for non-200 responses)
+        """
+        if self._api is not None:
+            handler = getattr(self._api, endpoint)
+            result, status_code = handler(payload)
+            return status_code, result if status_code == 200 else None
+        
+        response = self._session.post(
+            f"{self.api_url}/{endpoint}", 
+            json=payload,
+            headers=self.headers,
+            timeout=Config.READ_TIMEOUT
+        )
+        return response.status_code, response.json() if response.status_code == 200 else None
+        
     def is_server_running(self) -> bool:
         """Check if memory server is running"""
+        if self._api is not None:
+            return self._api.memory_system is not None
         try:
-            response = requests.get(f"{self.api_url}/status", timeout=2)
-            return response.status_code == 200
+            response = self._session.get(f"{self.api_url}/status", timeout=2)
+            # A rate-limited server is still up
+            return response.status_code in (200, 429)
         except:
             return False
     
     def query_memory(self, user_input: str, max_results: int = 3) -> Dict:
-        """Query memory for relevant insights"""
+        """
+        Query memory for relevant insights
+        
+        Failed queries return {"error": message, "error_kind": kind}, where
+        kind is "input" for a rejected request, "server" for a 5xx response
+        and "connection" when the API could not be reached.
+        """
         if not user_input.strip():
             self.logger.warning("Empty input provided to query_memory")
-            return {"error": "Empty input"}
+            return {"error": "Empty input", "error_kind": "input"}
         
         try:
             self.logger.debug(f"Querying memory with input: {user_input[:100]}...")
             
-            response = requests.post(
-                f"{self.api_url}/query", 
-                json={"input": user_input, "max_results": max_results},
-                headers=self.headers,
-                timeout=Config.READ_TIMEOUT
+            status_code, result = self._post(
+                "query",
+                {"input": user_input, "max_results": max_results}
             )
             
-            if response.status_code == 200:
-                result = response.json()
+            if status_code == 200:
                 self.logger.info(f"Query returned {len(result.get('insights', []))} insights")
                 return result
             else:
-                error_msg = f"API error: {response.status_code}"
+                error_msg = f"API error: {status_code}"
                 self.logger.error(error_msg)
-                return {"error": error_msg}
+                return {
+                    "error": error_msg,
+                    "error_kind": "server" if status_code >= 500 else "input"
+                }
                 
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Connection error: {str(e)}")
-            return {"error": f"Connection error: {str(e)}"}
+            return {"error": f"Connection error: {str(e)}", "error_kind": "connection"}
     
     def add_insight(self, content: str, entities: List[str], themes: List[str], 
                    insight_type: str = "observation", effectiveness_score: float = 0.5) -> Dict:
@@ -175,37 +225,41 @@ class MemoryClient:
         try:
             self.logger.debug(f"Adding insight: {content[:100]}...")
             
-            response = requests.post(
-                f"{self.api_url}/add", 
-                json={
+            status_code, result = self._post(
+                "add",
+                {
                     "content": content,
                     "entities": normalized_entities,
                     "themes": themes,
                     "insight_type": insight_type,
                     "effectiveness_score": effectiveness_score,
                     "context": f"Added by Claude at {datetime.now().isoformat()}"
-                },
-                headers=self.headers,
-                timeout=Config.READ_TIMEOUT
+                }
             )
             
-            if response.status_code == 200:
-                result = response.json()
+            if status_code == 200:
                 self.logger.info(f"Successfully added insight: {result.get('insight_id')}")
                 return result
             else:
-                error_msg = f"API error: {response.status_code}"
+                error_msg = f"API error: {status_code}"
                 self.logger.error(error_msg)
-                return {"error": error_msg}
+                return {
+                    "error": error_msg,
+                    "error_kind": "server" if status_code >= 500 else "input"
+                }
                 
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Connection error: {str(e)}")
-            return {"error": f"Connection error: {str(e)}"}
+            return {"error": f"Connection error: {str(e)}", "error_kind": "connection"}
     
     def get_status(self) -> Dict:
         """Get memory system status"""
+        if self._api is not None:
+            if self._api.memory_system is None:
+                return {"error": "Memory system not initialized"}
+            return self._api.status_payload()
         try:
-            response = requests.get(f"{self.api_url}/status", timeout=Config.CONNECTION_TIMEOUT)
+            response = self._session.get(f"{self.api_url}/status", timeout=Config.CONNECTION_TIMEOUT)
             if response.status_code == 200:
                 result = response.json()
                 self.logger.debug(f"Memory system status: {result.get('status')}")
@@ -219,6 +273,27 @@ class MemoryClient:
             return {"error": "Cannot connect to memory server"}
 
 
+# Phrases that might indicate insights
+INSIGHT_PHRASES = [
+    "I realized that",
+    "What worked was",
+    "The strategy that helped was",
+    "I learned that",
+    "It's important to remember",
+    "The key insight is",
+    "What I discovered is",
+    "I now understand that"
+]
+
+INSIGHT_PATTERNS = [re.compile(re.escape(phrase) + r" (.+)", re.IGNORECASE)
+                    for phrase in INSIGHT_PHRASES]
+
+# One alternation over every phrase, so text without any of them is
+# rejected in a single scan
+_INSIGHT_PREFILTER = re.compile(
+    "|".join(re.escape(phrase) + " " for phrase in INSIGHT_PHRASES), re.IGNORECASE)
+
+
 def extract_insights_from_conversation(conversation_text: str) -> List[Dict]:
     """
     Extract potential insights from conversation text.
@@ -226,20 +301,11 @@ def extract_insights_from_conversation(conversation_text: str) -> List[Dict]:
     """
     insights = []
     
-    # Patterns that might indicate insights
-    insight_patterns = [
-        r"I realized that (.+)",
-        r"What worked was (.+)",
-        r"The strategy that helped was (.+)",
-        r"I learned that (.+)",
-        r"It's important to remember (.+)",
-        r"The key insight is (.+)",
-        r"What I discovered is (.+)",
-        r"I now understand that (.+)"
-    ]
+    if not _INSIGHT_PREFILTER.search(conversation_text):
+        return insights
     
-    for pattern in insight_patterns:
-        matches = re.findall(pattern, conversation_text, re.IGNORECASE)
+    for pattern in INSIGHT_PATTERNS:
+        matches = pattern.findall(conversation_text)
         for match in matches:
             if len(match.strip()) > 10:  # Only meaningful insights
                 insights.append({
@@ -319,6 +385,15 @@ def extract_themes_from_text(text: str) -> List[str]:
     return themes
 
 
+# Display marker per insight type
+INSIGHT_TYPE_EMOJI = {
+    "anchor": "⚓",
+    "breakthrough": "💡", 
+    "strategy": "🎯",
+    "observation": "👁️"
+}
+
+
 def format_insights_for_claude(insights: List[Dict]) -> str:
     """Format insights for Claude to use in conversation"""
     if not insights:
@@ -327,18 +402,12 @@ def format_insights_for_claude(insights: List[Dict]) -> str:
     formatted = ["**Relevant Memory Insights:**"]
     
     for insight in insights:
-        type_emoji = {
-            "anchor": "⚓",
-            "breakthrough": "💡", 
-            "strategy": "🎯",
-            "observation": "👁️"
-        }.get(insight.get("type", "observation"), "•")
-        
+        type_emoji = INSIGHT_TYPE_EMOJI.get(insight.get("type", "observation"), "•")
         formatted.append(f"{type_emoji} {insight['content']}")
         
         if insight.get('entities'):
             # Display entities in readable format
-            entity_display = ', '.join([denormalize_entity(e) for e in insight['entities']])
+            entity_display = ', '.join(map(denormalize_entity, insight['entities']))
             formatted.append(f"   *Relates to: {entity_display}*")
     
     return "\n".join(formatted)
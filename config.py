@@ -1,6 +1,9 @@
 """
 Configuration management for Claude Memory System
 """
+import functools
+import hashlib
+import hmac
 import os
 import secrets
 from pathlib import Path
@@ -64,11 +67,14 @@ class Config:
         return cls.TEST_DATABASE_PATH if test else cls.DATABASE_PATH
     
     @classmethod
+    @functools.lru_cache(maxsize=64)
     def generate_secure_token(cls, data: str) -> str:
-        """Generate a secure token using secrets module"""
-        import hashlib
-        import hmac
+        """
+        Generate a secure token using secrets module
         
+        Results are cached per path; call generate_secure_token.cache_clear()
+        after changing SECRET_KEY.
+        """
         # Use HMAC with secret key for secure token generation
         return hmac.new(
             cls.SECRET_KEY.encode(),
@@ -7,10 +7,11 @@ For initial testing and demonstration
 import json
 import re
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Set
+from typing import Dict, Iterable, List, Tuple, Optional, Set
 from dataclasses import dataclass, field
 from pathlib import Path
 import sqlite3
+import tempfile
 import uuid
 import threading
 from contextlib import contextmanager
@@ -80,6 +81,7 @@ class ConnectionPool:
         conn.execute('PRAGMA synchronous=NORMAL')
         conn.execute('PRAGMA cache_size=-64000')  # 64MB cache
         conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')  # 256MB memory-mapped reads
         
         # Row factory for easier access
         conn.row_factory = sqlite3.Row
@@ -143,10 +145,15 @@ class SimpleContextualInsightRetrieval:
     def __init__(self, db_path: str = "insights_simple.db", pool_size: int = 5):
         self.db_path = db_path
         self.semantic_triggers = self._initialize_triggers()
+        self._trigger_prefilter = self._compile_trigger_prefilter()
         
         # Initialize connection pool
         self.pool = ConnectionPool(db_path, pool_size)
         
+        # WAL allows one writer at a time; serialize writers here instead of
+        # letting them spin on SQLite's busy timeout. Readers are unaffected.
+        self._write_lock = threading.Lock()
+        
         # Initialize database schema
         self._init_database()
     
@@ -235,11 +242,27 @@ class SimpleContextualInsightRetrieval:
         
         return triggers
     
+    def _compile_trigger_prefilter(self) -> re.Pattern:
+        """
+        Compile every term detect_context_triggers matches on into one regex,
+        so inputs that can't activate any trigger are rejected in a single scan
+        """
+        terms = set()
+        for trigger in self.semantic_triggers.values():
+            terms.add(trigger.entity.lower())
+            terms.update(trigger.keywords)
+        
+        # Longest first so the alternation reads naturally; any match is enough
+        return re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)))
+    
     def detect_context_triggers(self, user_input: str) -> List[str]:
         """Detect activated triggers"""
         activated = set()
         user_lower = user_input.lower()
         
+        if not self._trigger_prefilter.search(user_lower):
+            return []
+        
         for trigger_name, trigger in self.semantic_triggers.items():
             if (trigger.entity.lower() in user_lower or
                 any(keyword in user_lower for keyword in trigger.keywords)):
@@ -249,48 +272,85 @@ class SimpleContextualInsightRetrieval:
         
         return sorted(activated)
     
-    def add_insight(self, insight: Insight):
-        """Add insight to database using connection pool"""
+    @staticmethod
+    def _insight_to_row(insight: Insight) -> Tuple:
+        """Convert an insight into a row tuple for the insights table"""
         # Store entities with leading/trailing commas for exact matching
         entities_str = ',' + ','.join(insight.entities) + ',' if insight.entities else ''
         themes_str = ',' + ','.join(insight.themes) + ',' if insight.themes else ''
         supersedes_str = ',' + ','.join(insight.supersedes) + ',' if insight.supersedes else ''
-        
-        with self.pool.get_connection() as conn:
+
+        return (
+            insight.id,
+            insight.content,
+            entities_str,
+            themes_str,
+            insight.timestamp.isoformat(),
+            insight.effectiveness_score,
+            insight.growth_stage,
+            insight.layer,
+            insight.insight_type,
+            supersedes_str,
+            insight.superseded_by,
+            insight.source_file,
+            insight.context
+        )
+
+    def add_insight(self, insight: Insight):
+        """Add insight to database using connection pool"""
+        with self._write_lock, self.pool.get_connection() as conn:
             cursor = conn.cursor()
-            
+
             cursor.execute('''
-                INSERT OR REPLACE INTO insights VALUES 
+                INSERT OR REPLACE INTO insights VALUES
                 (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                insight.id,
-                insight.content,
-                entities_str,
-                themes_str,
-                insight.timestamp.isoformat(),
-                insight.effectiveness_score,
-                insight.growth_stage,
-                insight.layer,
-                insight.insight_type,
-                supersedes_str,
-                insight.superseded_by,
-                insight.source_file,
-                insight.context
-            ))
-            
+            ''', self._insight_to_row(insight))
+
             conn.commit()
-    
-    def retrieve_contextual_insights(self, user_input: str, max_insights: int = 5) -> Dict[str, List[Insight]]:
-        """Retrieve relevant insights using connection pool"""
+
+    def add_insights_bulk(self, insights: Iterable[Insight]):
+        """
+        Add many insights in a single transaction
+
+        Connections run in autocommit mode, so the transaction is opened
+        explicitly to commit all rows with one write.
+        """
+        with self._write_lock, self.pool.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('BEGIN')
+            try:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO insights VALUES
+                    (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (self._insight_to_row(insight) for insight in insights))
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def retrieve_contextual_insights(self, user_input: str, max_insights: int = 5,
+                                     surface_limit: int = 3) -> Dict[str, List[Insight]]:
+        """
+        Retrieve relevant insights using connection pool
+        
+        Args:
+            user_input: Text to detect triggers in
+            max_insights: Maximum deep-layer insights to return
+            surface_limit: Maximum surface-layer insights to return
+        """
         triggers = self.detect_context_triggers(user_input)
         
         if not triggers:
             return {"surface": [], "mid": [], "deep": []}
         
+        # Only fetch as many rows per layer as can be returned
+        layer_limits = {"surface": surface_limit, "mid": 5, "deep": max_insights}
+        
         # Get insights for activated triggers
         all_insights = []
         for trigger_name in triggers:
-            entity_insights = self._get_insights_by_entity(trigger_name)
+            entity_insights = self._get_insights_by_entity(trigger_name, layer_limits)
             all_insights.extend(entity_insights)
         
         # Remove duplicates while preserving order
@@ -301,31 +361,59 @@ class SimpleContextualInsightRetrieval:
                 seen_ids.add(insight.id)
                 unique_insights.append(insight)
         
-        # Sort by effectiveness and recency
+        # Sort by effectiveness and recency, reading the clock once per query
+        now = datetime.now()
         unique_insights.sort(
-            key=lambda x: (x.effectiveness_score, -(datetime.now() - x.timestamp).days), 
+            key=lambda x: (x.effectiveness_score, -(now - x.timestamp).days), 
             reverse=True
         )
         
         # Categorize by layer
-        surface = [i for i in unique_insights if i.layer == "surface"][:3]
-        mid = [i for i in unique_insights if i.layer == "mid"][:5]  
-        deep = [i for i in unique_insights if i.layer == "deep"][:max_insights]
+        surface = [i for i in unique_insights if i.layer == "surface"][:layer_limits["surface"]]
+        mid = [i for i in unique_insights if i.layer == "mid"][:layer_limits["mid"]]
+        deep = [i for i in unique_insights if i.layer == "deep"][:layer_limits["deep"]]
         
         return {"surface": surface, "mid": mid, "deep": deep}
     
-    def _get_insights_by_entity(self, entity: str) -> List[Insight]:
-        """Get insights for entity from database using connection pool"""
+    def _get_insights_by_entity(self, entity: str,
+                                layer_limits: Optional[Dict[str, int]] = None) -> List[Insight]:
+        """
+        Get insights for entity from database using connection pool
+        
+        Args:
+            entity: Entity name to match
+            layer_limits: Optional maximum rows per layer; layers not listed
+                are excluded. Fetches everything when omitted.
+        """
         with self.pool.get_connection() as conn:
             cursor = conn.cursor()
             
             # Use exact entity matching with comma delimiters to avoid false matches
             # e.g., searching for "N" won't match "AN" or "IN"
-            cursor.execute('''
-                SELECT * FROM insights 
-                WHERE entities LIKE ? 
-                ORDER BY effectiveness_score DESC, timestamp DESC
-            ''', (f'%,{entity},%',))
+            if layer_limits is None:
+                cursor.execute('''
+                    SELECT * FROM insights 
+                    WHERE entities LIKE ? 
+                    ORDER BY effectiveness_score DESC, timestamp DESC
+                ''', (f'%,{entity},%',))
+            else:
+                # Rank rows within each layer so LIMIT applies per layer
+                layer_filter = ' OR '.join(['(layer = ? AND layer_rank <= ?)'] * len(layer_limits))
+                params = [f'%,{entity},%']
+                for layer, limit in layer_limits.items():
+                    params.extend((layer, limit))
+                cursor.execute(f'''
+                    SELECT * FROM (
+                        SELECT *, ROW_NUMBER() OVER (
+                            PARTITION BY layer
+                            ORDER BY effectiveness_score DESC, timestamp DESC
+                        ) AS layer_rank
+                        FROM insights
+                        WHERE entities LIKE ?
+                    )
+                    WHERE {layer_filter}
+                    ORDER BY effectiveness_score DESC, timestamp DESC
+                ''', params)
             
             rows = cursor.fetchall()
         
@@ -359,7 +447,33 @@ class SimpleContextualInsightRetrieval:
             insights.append(insight)
         
         return insights
-    
+
+    def entity_stats(self, entities: List[str]) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        Get insight count and latest timestamp per entity
+
+        Aggregates in SQL so no Insight objects are built.
+
+        Args:
+            entities: Entity names to report on
+
+        Returns:
+            Dict mapping entity to {"count": int, "latest": ISO timestamp or None}
+        """
+        stats = {}
+        with self.pool.get_connection() as conn:
+            cursor = conn.cursor()
+
+            for entity in entities:
+                cursor.execute('''
+                    SELECT COUNT(*), MAX(timestamp) FROM insights
+                    WHERE entities LIKE ?
+                ''', (f'%,{entity},%',))
+                count, latest = cursor.fetchone()
+                stats[entity] = {"count": count, "latest": latest}
+
+        return stats
+
     def close(self):
         """Close all database connections"""
         self.pool.close_all()
@@ -378,8 +492,10 @@ def test_simple_system():
     print("Testing Simplified Contextual Insight Retrieval System")
     print("=" * 60)
     
-    # Initialize system with context manager for proper cleanup
-    with SimpleContextualInsightRetrieval("test_simple.db") as system:
+    # Initialize system with context manager for proper cleanup; the database
+    # lives in a throwaway directory so every run starts empty
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            SimpleContextualInsightRetrieval(str(Path(tmp_dir) / "test_simple.db")) as system:
         
         # Add test insights with descriptive entity names
         test_insights = [
@@ -412,9 +528,8 @@ def test_simple_system():
             )
         ]
         
-        # Add insights to system
-        for insight in test_insights:
-            system.add_insight(insight)
+        # Add insights to system in one transaction
+        system.add_insights_bulk(test_insights)
         
         print("✓ Test insights added with descriptive entity names")
         
@@ -7,13 +7,14 @@ import os
 import sys
 from pathlib import Path
 
-def setup_logging(name: str = 'claude_memory', level: str = None) -> logging.Logger:
+def setup_logging(name: str = 'claude_memory', level: str = None, stream=None) -> logging.Logger:
     """
     Setup centralized logging for the application
     
     Args:
         name: Logger name
         level: Logging level (DEBUG, INFO, WARNING, ERROR)
+        stream: Console output stream (defaults to stdout)
     
     Returns:
         Configured logger instance
@@ -40,7 +41,7 @@ def setup_logging(name: str = 'claude_memory', level: str = None) -> logging.Log
     )
     
     # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = logging.StreamHandler(stream or sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(simple_formatter)
     logger.addHandler(console_handler)
@@ -4,9 +4,7 @@ Memory API for Claude Project Integration
 Lightweight HTTP API for querying and adding insights
 """
 
-from flask import Flask, request, jsonify
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from flask import Flask, request, g
 from insight_system_simple import SimpleContextualInsightRetrieval, Insight
 from datetime import datetime
 from config import Config
@@ -16,16 +14,22 @@ import json
 import threading
 import os
 import time
+from collections import OrderedDict
 from functools import wraps
+from operator import attrgetter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
-# Setup rate limiting (using in-memory storage for local development)
-limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=[f"{Config.RATE_LIMIT_PER_MINUTE} per minute"]
-)
-limiter.init_app(app)
+# Reject oversized bodies before they are read. The largest valid body is a
+# 5000-character /query input; JSON clients escape non-ASCII as \uXXXX (up
+# to 12 bytes per character for surrogate pairs), so 64KB covers it with
+# room for the envelope
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024
 
 # Setup logging
 logger = get_logger('memory_api')
@@ -33,26 +37,104 @@ logger = get_logger('memory_api')
 # Global memory system instance
 memory_system = None
 
+# Short-lived cache for /entities, cleared whenever an insight is added
+ENTITY_CACHE_TTL = 5.0
+_entity_cache = {'ts': 0.0, 'data': None}
+_entity_cache_lock = threading.Lock()
+
+# Query result cache. Retrieval depends only on which triggers the input
+# activates, so inputs that activate the same triggers (e.g. "trust issues
+# with A" and "A trust problems") share an entry. Cleared whenever an
+# insight is added.
+QUERY_CACHE_TTL = 60.0
+QUERY_CACHE_MAX_ENTRIES = 256
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+# Bumped (under _query_cache_lock) on every add. Readers note it before
+# touching the database and only cache their result if it is unchanged, so a
+# read that raced an add can't store a stale entry after the caches are cleared
+_cache_generation = 0
+
+# Fixed-window rate limit counters: (client, endpoint) -> (window, count).
+# Bounded so an address sweep can't grow it without limit; oldest keys
+# are evicted first.
+RATE_LIMIT_MAX_KEYS = 4096
+_rate_counters = OrderedDict()
+_rate_lock = threading.Lock()
+
+# Insight attributes returned by /query, fetched in one call per insight
+_INSIGHT_FIELDS = attrgetter(
+    'content', 'insight_type', 'entities', 'themes', 'effectiveness_score', 'timestamp'
+)
+
+def _json_default(obj):
+    """Fallback serializer for types stdlib json can't handle"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def json_dumps(obj) -> bytes:
+    """Serialize obj to JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_DATACLASS)
+    return json.dumps(obj, default=_json_default).encode()
+
+def ojsonify(obj, status=200):
+    """Build a JSON response from obj"""
+    return app.response_class(json_dumps(obj), status=status, mimetype='application/json')
+
+def ratelimit(limit=Config.RATE_LIMIT_PER_MINUTE):
+    """Decorator to limit requests per client address per minute"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (request.remote_addr, request.endpoint)
+            window = int(time.time() // 60)
+            
+            with _rate_lock:
+                entry = _rate_counters.get(key)
+                count = entry[1] + 1 if entry is not None and entry[0] == window else 1
+                _rate_counters[key] = (window, count)
+                _rate_counters.move_to_end(key)
+                if len(_rate_counters) > RATE_LIMIT_MAX_KEYS:
+                    _rate_counters.popitem(last=False)
+            
+            if count > limit:
+                logger.warning(f"Rate limit exceeded for {request.remote_addr} on {request.endpoint}")
+                return ojsonify({"error": f"Rate limit exceeded ({limit} per minute)"}, 429)
+            
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 def validate_input(required_fields=None):
     """Decorator to validate request input"""
+    # Resolve the required field set once at decoration time
+    required_set = frozenset(required_fields or ())
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not request.is_json:
-                logger.warning(f"Invalid content type for {request.endpoint}")
-                return jsonify({"error": "Content-Type must be application/json"}), 400
+            content_length = request.content_length
+            if content_length and content_length > app.config['MAX_CONTENT_LENGTH']:
+                logger.warning(f"Request body too large for {request.endpoint}: {content_length} bytes")
+                return ojsonify({"error": "Request body too large"}, 413)
             
-            data = request.get_json(silent=True)
-            if data is None:
+            # get_json() returns None for non-JSON content types and bad bodies
+            data = request.get_json(silent=True, force=False, cache=True)
+            if data is None or not isinstance(data, dict):
                 logger.warning(f"Invalid JSON for {request.endpoint}")
-                return jsonify({"error": "Invalid JSON"}), 400
+                return ojsonify({"error": "Content-Type must be application/json with a JSON object body"}, 400)
             
-            if required_fields:
-                missing_fields = [field for field in required_fields if field not in data]
-                if missing_fields:
-                    logger.warning(f"Missing required fields: {missing_fields}")
-                    return jsonify({"error": f"Missing required fields: {missing_fields}"}), 400
+            missing_fields = required_set.difference(data)
+            if missing_fields:
+                missing_fields = sorted(missing_fields)
+                logger.warning(f"Missing required fields: {missing_fields}")
+                return ojsonify({"error": f"Missing required fields: {missing_fields}"}, 400)
             
+            # Share the parsed body with the handler
+            g.json_data = data
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -76,8 +158,8 @@ def verify_access_token():
             logger.debug(f"Valid access token from {request.remote_addr}")
             return True
     
-    # Also check token for current server directory (expanded)
-    current_dir = os.path.expanduser(os.getcwd())
+    # Also check token for the server directory, resolved once at startup
+    current_dir = app.config.get('SERVER_DIR') or os.path.expanduser(os.getcwd())
     expected_token = Config.generate_secure_token(current_dir)
     
     if provided_token == expected_token:
@@ -92,6 +174,9 @@ def init_memory_system():
     global memory_system
     
     try:
+        # Drop tokens derived from a previous SECRET_KEY
+        Config.generate_secure_token.cache_clear()
+        
         current_dir = os.getcwd()
         
         # Check if running from allowed project directory
@@ -99,6 +184,7 @@ def init_memory_system():
             logger.error(f"Memory system access denied from: {current_dir}")
             logger.error(f"Must run from allowed directories: {Config.ALLOWED_PROJECT_DIRS}")
             return None
+        app.config['SERVER_DIR'] = current_dir
         
         # Get database path from config (handles directory creation)
         db_path = Config.get_database_path()
@@ -115,6 +201,9 @@ def init_memory_system():
             logger.info(f"Setting up new memory database at: {db_path}")
             setup_demo_data()
         
+        # The healthy /status body never changes, so serialize it once
+        app.config['STATUS_OK_BYTES'] = json_dumps(status_payload())
+        
         logger.info("Memory system initialized successfully")
         return memory_system
         
@@ -122,6 +211,16 @@ def init_memory_system():
         logger.error(f"Failed to initialize memory system: {e}")
         return None
 
+def status_payload() -> dict:
+    """Status reported while the memory system is running"""
+    return {
+        "status": "running",
+        "total_insights": "available",
+        "entities": ["A", "N", "X", "trauma_responses"],  # Known entities
+        "version": "1.0.0",
+        "port": Config.API_PORT
+    }
+
 def setup_demo_data():
     """Setup demo insights"""
     demo_insights = [
@@ -175,84 +274,117 @@ def setup_demo_data():
         )
     ]
     
-    for insight in demo_insights:
-        memory_system.add_insight(insight)
+    memory_system.add_insights_bulk(demo_insights)
 
-@app.route('/query', methods=['POST'])
-@limiter.limit(f"{Config.RATE_LIMIT_PER_MINUTE} per minute")
-@validate_input(required_fields=['input'])
-def query_insights():
-    """Query insights based on input text"""
-    if not verify_access_token():
-        return jsonify({"error": "Unauthorized access"}), 401
+def query(data: dict):
+    """
+    Query insights for a request payload
+    
+    Shared by the /query route and in-process clients.
     
+    Returns:
+        Tuple of (response payload, HTTP status code)
+    """
     if memory_system is None:
         logger.error("Memory system not initialized")
-        return jsonify({"error": "Memory system not available"}), 503
+        return {"error": "Memory system not available"}, 503
     
     try:
-        data = request.json
         user_input = data.get('input', '').strip()
-        max_results = min(data.get('max_results', 3), 10)  # Cap at 10 results
+        max_results = max(0, min(data.get('max_results', 3), 10))  # Cap at 10 results
         
         if len(user_input) > 5000:  # Limit input length
             logger.warning(f"Input too long: {len(user_input)} characters")
-            return jsonify({"error": "Input too long (max 5000 characters)"}), 400
+            return {"error": "Input too long (max 5000 characters)"}, 400
         
         logger.info(f"Querying insights for input: {user_input[:100]}...")
         
         start_time = time.time()
-        insights = memory_system.retrieve_contextual_insights(user_input)
-        query_time = time.time() - start_time
+        triggers = memory_system.detect_context_triggers(user_input)
+        cache_key = (tuple(triggers), max_results)
+        
+        with _query_cache_lock:
+            generation = _cache_generation
+            cached = _query_cache.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < QUERY_CACHE_TTL:
+                _query_cache.move_to_end(cache_key)
+            else:
+                cached = None
+        
+        if cached is not None:
+            _, formatted_insights, total_available = cached
+        else:
+            # Fetch at least the default three surface rows so total_available
+            # still reports them when fewer are requested
+            insights = memory_system.retrieve_contextual_insights(
+                user_input, surface_limit=max(max_results, 3))
+            surface = insights.get("surface") or ()
+            
+            # Format for Claude (sets become lists; orjson can't encode sets)
+            formatted_insights = [
+                {
+                    "content": content,
+                    "type": insight_type,
+                    "entities": list(entities),
+                    "themes": list(themes),
+                    "effectiveness": effectiveness,
+                    "timestamp": timestamp
+                }
+                for content, insight_type, entities, themes, effectiveness, timestamp
+                in map(_INSIGHT_FIELDS, surface[:max_results])
+            ]
+            total_available = len(surface) + len(insights.get("mid") or ())
+            
+            with _query_cache_lock:
+                if generation == _cache_generation:
+                    _query_cache[cache_key] = (time.monotonic(), formatted_insights, total_available)
+                    _query_cache.move_to_end(cache_key)
+                    if len(_query_cache) > QUERY_CACHE_MAX_ENTRIES:
+                        _query_cache.popitem(last=False)
         
-        # Format for Claude
-        formatted_insights = []
-        for insight in insights.get("surface", [])[:max_results]:
-            formatted_insights.append({
-                "content": insight.content,
-                "type": insight.insight_type,
-                "entities": list(insight.entities),
-                "themes": list(insight.themes),
-                "effectiveness": insight.effectiveness_score,
-                "timestamp": insight.timestamp.isoformat()
-            })
+        query_time = time.time() - start_time
         
-        logger.info(f"Query completed in {query_time:.3f}s, returned {len(formatted_insights)} insights")
+        logger.info(f"Query completed in {query_time:.3f}s, returned {len(formatted_insights)} insights"
+                    f"{' (cached)' if cached is not None else ''}")
         
-        return jsonify({
+        return {
             "insights": formatted_insights,
-            "triggers": memory_system.detect_context_triggers(user_input),
-            "total_available": len(insights.get("surface", []) + insights.get("mid", [])),
+            "triggers": triggers,
+            "total_available": total_available,
             "query_time": query_time
-        })
+        }, 200
         
     except Exception as e:
         logger.error(f"Error querying insights: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return {"error": "Internal server error"}, 500
 
-@app.route('/add', methods=['POST'])
-@limiter.limit(f"{Config.RATE_LIMIT_PER_MINUTE} per minute")
-@validate_input(required_fields=['content'])
-def add_insight():
-    """Add new insight"""
-    if not verify_access_token():
-        return jsonify({"error": "Unauthorized access"}), 401
+def add(data: dict):
+    """
+    Add an insight from a request payload
+    
+    Shared by the /add route and in-process clients.
+    
+    Returns:
+        Tuple of (response payload, HTTP status code)
+    """
+    global _cache_generation
     
     if memory_system is None:
         logger.error("Memory system not initialized")
-        return jsonify({"error": "Memory system not available"}), 503
+        return {"error": "Memory system not available"}, 503
     
     try:
-        data = request.json
-        
         content = data.get('content', '').strip()
         if not content or len(content) > 2000:
-            return jsonify({"error": "Content must be between 1 and 2000 characters"}), 400
+            return {"error": "Content must be between 1 and 2000 characters"}, 400
         
-        # Validate effectiveness score
-        effectiveness_score = data.get('effectiveness_score', 0.5)
-        if not isinstance(effectiveness_score, (int, float)) or not 0 <= effectiveness_score <= 1:
-            return jsonify({"error": "Effectiveness score must be between 0 and 1"}), 400
+        # Validate effectiveness score (numeric strings are accepted, NaN is not)
+        try:
+            effectiveness_score = float(data.get('effectiveness_score', 0.5))
+        except (TypeError, ValueError):
+            return {"error": "Effectiveness score must be between 0 and 1"}, 400
+        if effectiveness_score != effectiveness_score or not 0.0 <= effectiveness_score <= 1.0:
+            return {"error": "Effectiveness score must be between 0 and 1"}, 400
         
         insight = Insight(
             id=str(uuid.uuid4()),
@@ -268,70 +400,89 @@ def add_insight():
         )
         
         memory_system.add_insight(insight)
+        with _query_cache_lock:
+            _cache_generation += 1
+            _query_cache.clear()
+        with _entity_cache_lock:
+            _entity_cache['data'] = None
         logger.info(f"Added insight: {insight.id} - {content[:100]}...")
         
-        return jsonify({
+        return {
             "success": True,
             "insight_id": insight.id,
             "message": "Insight added successfully"
-        })
+        }, 200
         
     except Exception as e:
         logger.error(f"Error adding insight: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return {"error": "Internal server error"}, 500
+
+@app.route('/query', methods=['POST'])
+@ratelimit()
+@validate_input(required_fields=['input'])
+def query_insights():
+    """Query insights based on input text"""
+    if not verify_access_token():
+        return ojsonify({"error": "Unauthorized access"}, 401)
+    
+    return ojsonify(*query(g.json_data))
+
+@app.route('/add', methods=['POST'])
+@ratelimit()
+@validate_input(required_fields=['content'])
+def add_insight():
+    """Add new insight"""
+    if not verify_access_token():
+        return ojsonify({"error": "Unauthorized access"}, 401)
+    
+    return ojsonify(*add(g.json_data))
 
 @app.route('/status', methods=['GET'])
+@ratelimit()
 def status():
     """Get system status"""
     # Check if memory system is initialized
     if memory_system is None:
-        return jsonify({
+        return ojsonify({
             "status": "error",
             "error": "Memory system not initialized"
-        }), 503
+        }, 503)
     
     try:
-        # Get basic system info without querying database directly
-        return jsonify({
-            "status": "running",
-            "total_insights": "available",
-            "entities": ["A", "N", "X", "trauma_responses"],  # Known entities
-            "version": "1.0.0",
-            "port": Config.API_PORT
-        })
+        # Body is serialized once by init_memory_system
+        return app.response_class(app.config['STATUS_OK_BYTES'], mimetype='application/json')
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             "status": "error",
             "error": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/entities', methods=['GET'])
+@ratelimit()
 def get_entities():
     """Get all entities being tracked"""
     if memory_system is None:
-        return jsonify({"error": "Memory system not initialized"}), 503
+        return ojsonify({"error": "Memory system not initialized"}, 503)
+    
+    with _entity_cache_lock:
+        cached = _entity_cache['data']
+        if cached is not None and time.monotonic() - _entity_cache['ts'] < ENTITY_CACHE_TTL:
+            return ojsonify(cached)
+    generation = _cache_generation
     
     try:
         # Get stats for known entities
         entities = ["A", "N", "X", "trauma_responses"]
-        entity_stats = {}
+        entity_stats = memory_system.entity_stats(entities)
         
-        for entity in entities:
-            try:
-                insights = memory_system._get_insights_by_entity(entity)
-                entity_stats[entity] = {
-                    "count": len(insights),
-                    "latest": max(i.timestamp for i in insights).isoformat() if insights else None
-                }
-            except Exception:
-                entity_stats[entity] = {
-                    "count": 0,
-                    "latest": None
-                }
+        with _entity_cache_lock:
+            if generation == _cache_generation:
+                _entity_cache['data'] = entity_stats
+                _entity_cache['ts'] = time.monotonic()
         
-        return jsonify(entity_stats)
+        return ojsonify(entity_stats)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
 
 def run_server():
     """Run the Flask server"""
@@ -5,8 +5,14 @@ Simple MCP Server for Memory System - Fixed Implementation
 
 import asyncio
 import json
+import os
+import stat
 import sys
+import threading
+import time
+import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
 # Configure logging to stderr so we can see what's happening
@@ -14,109 +20,229 @@ logging.basicConfig(level=logging.INFO, stream=sys.stderr,
                     format='%(asctime)s [MCP] %(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-from claude_memory_client import MemoryClient
+# stdout is the JSON-RPC channel, so the shared loggers must not print there;
+# registering them first makes later get_logger() calls reuse these handlers.
+# This covers memory_api too when it runs in-process (MEMORY_INPROC=1).
+# They have their own stderr handler, so don't also pass records to root's.
+from logging_config import setup_logging
+for _name in ("memory_api", "claude_memory_client"):
+    setup_logging(_name, stream=sys.stderr).propagate = False
+
+from claude_memory_client import MemoryClient, extract_insights_from_conversation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+def json_loads(data: bytes):
+    """Parse a JSON message, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj) -> bytes:
+    """Serialize a JSON message to bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+# How long a health probe result is trusted before re-probing
+HEALTH_TTL = 2.0
+
+# The health cache is only kept warm while a tool was called this recently,
+# so an idle server doesn't spend the API's /status rate limit
+HEALTH_ACTIVE_WINDOW = 60.0
+
+# Consecutive memory failures before calls are short-circuited, and for how long
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 10.0
+
+# Maximum number of messages handled concurrently
+MAX_INFLIGHT = 32
+
+# Maximum queued responses written to stdout per flush
+WRITE_BATCH = 64
+
+# Seconds a finished insight-detection job is kept for polling
+JOB_RETENTION = 300.0
+
+# Unfinished insight-detection jobs allowed at once (further requests are
+# refused), and the threads that run them, kept apart from the default
+# executor used by the other tools
+MAX_JOBS = 4
+JOB_WORKERS = 2
+
+# Largest JSON-RPC line accepted from stdin; longer lines are rejected unparsed
+MAX_MSG = 1 << 20  # 1 MiB
+
+# get_memory_status text for a running server
+STATUS_TEMPLATE = "✅ Memory system is running\nPort: {port}\nStatus: {status}"
+
+# Tool definitions advertised by tools/list
+TOOLS = [
+    {
+        "name": "get_memory_status",
+        "description": "Get current status of the memory system",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "query_memory",
+        "description": "Query memory for relevant insights",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "minLength": 1,
+                    "description": "The query to search for"
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "detect_conversation_insights",
+        "description": "Start detecting insights in conversation text; returns a job id for poll_job",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "conversation_text": {
+                    "type": "string",
+                    "minLength": 1,
+                    "description": "Conversation text to analyze"
+                }
+            },
+            "required": ["conversation_text"]
+        }
+    },
+    {
+        "name": "poll_job",
+        "description": "Get the status or result of an insight-detection job",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job id returned by detect_conversation_insights"
+                }
+            },
+            "required": ["job_id"]
+        }
+    },
+    {
+        "name": "batch_execute",
+        "description": "Run several memory tool calls in one request",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "calls": {
+                    "type": "array",
+                    "description": "Tool calls to run",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "arguments": {"type": "object"}
+                        },
+                        "required": ["name"]
+                    }
+                },
+                "maxConcurrent": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "description": "Maximum calls to run at once",
+                    "default": 4
+                }
+            },
+            "required": ["calls"]
+        }
+    }
+]
 
 class SimpleMemoryMCPServer:
     def __init__(self):
-        self.memory_client = MemoryClient()
+        # MEMORY_INPROC=1 runs the memory API inside this process instead of
+        # calling a separate server over HTTP
+        self.memory_client = MemoryClient(in_process=os.getenv("MEMORY_INPROC") == "1")
         
+        # Circuit breaker for memory queries
+        self._breaker = {"fails": 0, "open_until": 0.0, "last_error": None}
+        
+        # Cached result of the last is_server_running() probe
+        self._health = {"ok": False, "ts": 0.0}
+        self._health_lock = asyncio.Lock()
+        self._last_tool_call = 0.0
+        
+        # Results of methods whose response never changes apart from the id,
+        # pre-serialized so _process only has to encode the id
+        self._static_results = {
+            "initialize": json_dumps({
+                "protocolVersion": "2024-11-05",
+                "capabilities": {
+                    "tools": {}
+                },
+                "serverInfo": {
+                    "name": "memory-system",
+                    "version": "1.0.0"
+                }
+            }),
+            "tools/list": json_dumps({"tools": TOOLS}),
+            "prompts/list": json_dumps({"prompts": []}),
+            "resources/list": json_dumps({"resources": []}),
+        }
+        
+        # JSON-RPC method and tool name lookup tables
+        self._method_dispatch = {
+            "tools/call": self.handle_tools_call,
+        }
+        self._tool_dispatch = {
+            "get_memory_status": self.get_memory_status,
+            "query_memory": self.query_memory,
+            "detect_conversation_insights": self.detect_conversation_insights,
+            "poll_job": self.poll_job,
+            "batch_execute": self.batch_execute,
+        }
+        
+        # Background insight-detection jobs: job id -> {"task", "finished"}
+        self._jobs = {}
+        self._job_executor = ThreadPoolExecutor(
+            max_workers=JOB_WORKERS, thread_name_prefix="insight-job")
+        
+        # Argument validators compiled once from each tool's inputSchema;
+        # without fastjsonschema handlers fall back to their own checks
+        self._validators = {}
+        if fastjsonschema is not None:
+            self._validators = {
+                tool["name"]: fastjsonschema.compile(tool["inputSchema"])
+                for tool in TOOLS
+            }
+        
+    @staticmethod
+    def _response_id(message: dict):
+        """Return the id to answer a message with; never null"""
+        msg_id = message.get("id")
+        return 0 if msg_id is None else msg_id
+    
     async def handle_message(self, message: dict) -> dict:
-        """Handle incoming MCP messages"""
+        """Handle incoming MCP messages; static methods are answered by _process"""
         try:
             method = message.get("method")
             params = message.get("params", {})
-            msg_id = message.get("id")
-            # Ensure msg_id is never null for responses
-            if msg_id is None:
-                msg_id = 0
+            msg_id = self._response_id(message)
             
             logger.info(f"Received method: {method}")
             
-            if method == "initialize":
-                return {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "protocolVersion": "2024-11-05",
-                        "capabilities": {
-                            "tools": {}
-                        },
-                        "serverInfo": {
-                            "name": "memory-system",
-                            "version": "1.0.0"
-                        }
-                    }
-                }
-                
-            elif method == "tools/list":
-                return {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "tools": [
-                            {
-                                "name": "get_memory_status",
-                                "description": "Get current status of the memory system",
-                                "inputSchema": {
-                                    "type": "object",
-                                    "properties": {}
-                                }
-                            },
-                            {
-                                "name": "query_memory",
-                                "description": "Query memory for relevant insights",
-                                "inputSchema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "query": {
-                                            "type": "string",
-                                            "description": "The query to search for"
-                                        }
-                                    },
-                                    "required": ["query"]
-                                }
-                            }
-                        ]
-                    }
-                }
-                
-            elif method == "tools/call":
-                tool_name = params.get("name")
-                arguments = params.get("arguments", {})
-                
-                if tool_name == "get_memory_status":
-                    return await self.get_memory_status(msg_id)
-                elif tool_name == "query_memory":
-                    return await self.query_memory(msg_id, arguments)
-                else:
-                    return {
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "error": {
-                            "code": -32601,
-                            "message": f"Unknown tool: {tool_name}"
-                        }
-                    }
-                    
-            elif method == "prompts/list":
-                return {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "prompts": []
-                    }
-                }
-                
-            elif method == "resources/list":
-                return {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "resources": []
-                    }
-                }
-                    
-            else:
+            handler = self._method_dispatch.get(method)
+            if handler is None:
                 return {
                     "jsonrpc": "2.0",
                     "id": msg_id,
@@ -125,6 +251,8 @@ class SimpleMemoryMCPServer:
                         "message": f"Method not found: {method}"
                     }
                 }
+            
+            return await handler(msg_id, params)
                 
         except Exception as e:
             logger.error(f"Error handling message: {e}")
@@ -137,117 +265,415 @@ class SimpleMemoryMCPServer:
                 }
             }
     
-    async def get_memory_status(self, msg_id):
-        """Get memory system status"""
-        try:
-            if self.memory_client.is_server_running():
-                status = self.memory_client.get_status()
-                result_text = f"✅ Memory system is running\nPort: 8001\nStatus: {status.get('status', 'unknown')}"
-            else:
-                result_text = "❌ Memory server is not running. Start with: ./start_server.sh"
-            
+    async def handle_tools_call(self, msg_id, params):
+        """Handle tools/call request"""
+        self._last_tool_call = time.monotonic()
+        tool_name = params.get("name")
+        arguments = params.get("arguments", {})
+        
+        handler = self._tool_dispatch.get(tool_name)
+        if handler is None:
             return {
                 "jsonrpc": "2.0",
                 "id": msg_id,
-                "result": {
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": result_text
-                        }
-                    ]
+                "error": {
+                    "code": -32601,
+                    "message": f"Unknown tool: {tool_name}"
                 }
             }
-        except Exception as e:
-            return {
-                "jsonrpc": "2.0", 
-                "id": msg_id,
-                "result": {
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Error checking status: {e}"
-                        }
-                    ]
-                }
+        
+        error = self._validate_arguments(tool_name, arguments)
+        if error is not None:
+            return self._text_result(msg_id, error, is_error=True)
+        
+        return await handler(msg_id, arguments)
+    
+    def _validate_arguments(self, tool_name, arguments):
+        """Check arguments against the tool's compiled schema; return an error message or None"""
+        validator = self._validators.get(tool_name)
+        if validator is None:
+            return None
+        try:
+            validator(arguments)
+        except fastjsonschema.JsonSchemaException as e:
+            return f"Invalid arguments for {tool_name}: {e.message}"
+        return None
+    
+    async def batch_execute(self, msg_id, arguments):
+        """Run several tool calls concurrently and return their results in order"""
+        calls = arguments.get("calls", [])
+        semaphore = asyncio.Semaphore(max(1, int(arguments.get("maxConcurrent", 4))))
+        
+        async def run_call(call):
+            name = call.get("name")
+            handler = self._tool_dispatch.get(name)
+            # Nested batches are rejected to keep concurrency bounded
+            if handler is None or name == "batch_execute":
+                return f"{name}: unknown tool"
+            
+            arguments = call.get("arguments", {})
+            error = self._validate_arguments(name, arguments)
+            if error is not None:
+                return error
+            
+            async with semaphore:
+                response = await handler(msg_id, arguments)
+            
+            if "error" in response:
+                return f"{name}: {response['error']['message']}"
+            return f"{name}: " + "\n".join(item["text"] for item in response["result"]["content"])
+        
+        results = await asyncio.gather(*(run_call(call) for call in calls))
+        
+        return {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "result": {
+                "content": [
+                    {
+                        "type": "text",
+                        "text": text
+                    }
+                    for text in results
+                ]
             }
+        }
+    
+    async def _probe_health(self) -> bool:
+        """Probe the memory server and cache the result"""
+        ok = await asyncio.to_thread(self.memory_client.is_server_running)
+        self._health = {"ok": ok, "ts": time.monotonic()}
+        return ok
+    
+    async def _health_ok(self) -> bool:
+        """Return cached server health, re-probing once the cache is stale"""
+        if time.monotonic() - self._health["ts"] < HEALTH_TTL:
+            return self._health["ok"]
+        
+        async with self._health_lock:
+            # Another caller may have refreshed while we waited
+            if time.monotonic() - self._health["ts"] < HEALTH_TTL:
+                return self._health["ok"]
+            return await self._probe_health()
+    
+    def _invalidate_health(self):
+        """Force the next health check to re-probe"""
+        self._health = {"ok": False, "ts": 0.0}
+    
+    async def _health_refresher(self):
+        """Keep the health cache warm in the background while tools are in use"""
+        while True:
+            if time.monotonic() - self._last_tool_call < HEALTH_ACTIVE_WINDOW:
+                try:
+                    async with self._health_lock:
+                        await self._probe_health()
+                except Exception as e:
+                    logger.error(f"Health probe failed: {e}")
+            await asyncio.sleep(HEALTH_TTL)
+    
+    async def get_memory_status(self, msg_id, arguments=None):
+        """Get memory system status"""
+        try:
+            if await self._health_ok():
+                status = await asyncio.to_thread(self.memory_client.get_status)
+                if "error" in status:
+                    self._invalidate_health()
+                result_text = STATUS_TEMPLATE.format_map({
+                    "port": status.get("port", 8001),
+                    "status": status.get("status", "unknown")
+                })
+            else:
+                result_text = "❌ Memory server is not running. Start with: ./start_server.sh"
+            
+            return self._text_result(msg_id, result_text)
+        except Exception as e:
+            return self._text_result(msg_id, f"Error checking status: {e}")
+    
+    def _record_failure(self, error):
+        """Count a failed memory call, opening the breaker after repeated failures"""
+        self._breaker["fails"] += 1
+        self._breaker["last_error"] = error
+        if self._breaker["fails"] >= BREAKER_THRESHOLD:
+            self._breaker["open_until"] = time.monotonic() + BREAKER_COOLDOWN
+            self._breaker["fails"] = 0
+            logger.warning(f"Memory server failing; pausing calls for {BREAKER_COOLDOWN:.0f}s")
     
     async def query_memory(self, msg_id, arguments):
         """Query memory system"""
         try:
-            query = arguments.get("query", "")
+            query = arguments.get("query", "").strip()
             if not query:
                 result_text = "No query provided"
+            elif time.monotonic() < self._breaker["open_until"]:
+                # Fail fast while the memory server keeps failing, rather than
+                # letting retries pile up against it
+                result_text = f"Query failed: {self._breaker['last_error']} (retrying shortly)"
             else:
-                result = self.memory_client.query_memory(query)
+                # MemoryClient uses blocking requests; keep the event loop free
+                result = await asyncio.to_thread(self.memory_client.query_memory, query)
                 if "error" in result:
+                    # Only an unreachable or failing backend trips the
+                    # breaker; a rejected query says nothing about its health
+                    if result.get("error_kind") in ("connection", "server"):
+                        self._invalidate_health()
+                        self._record_failure(result["error"])
                     result_text = f"Query failed: {result['error']}"
                 else:
+                    self._breaker["fails"] = 0
                     insights = result.get("insights", [])
                     if insights:
                         result_text = "**Found insights:**\n" + "\n".join([f"• {insight['content']}" for insight in insights])
                     else:
                         result_text = "No relevant insights found"
             
-            return {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": result_text
-                        }
-                    ]
-                }
-            }
+            return self._text_result(msg_id, result_text)
         except Exception as e:
-            return {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Error querying memory: {e}"
-                        }
-                    ]
-                }
-            }
+            return self._text_result(msg_id, f"Error querying memory: {e}")
 
+    def _text_result(self, msg_id, text, is_error=False):
+        """Build a tools/call response holding a single text item"""
+        result = {"content": [{"type": "text", "text": text}]}
+        if is_error:
+            result["isError"] = True
+        return {"jsonrpc": "2.0", "id": msg_id, "result": result}
+    
+    def _expire_jobs(self):
+        """Drop jobs that finished more than JOB_RETENTION ago"""
+        cutoff = time.monotonic() - JOB_RETENTION
+        for job_id, job in list(self._jobs.items()):
+            if job["finished"] is not None and job["finished"] < cutoff:
+                del self._jobs[job_id]
+    
+    async def detect_conversation_insights(self, msg_id, arguments):
+        """Start insight detection in the background and return its job id"""
+        conversation_text = arguments.get("conversation_text", "")
+        if not conversation_text:
+            return self._text_result(msg_id, "No conversation text provided")
+        
+        self._expire_jobs()
+        
+        # Each pending job holds its transcript; refuse new ones at the cap
+        if sum(not job["task"].done() for job in self._jobs.values()) >= MAX_JOBS:
+            return self._text_result(
+                msg_id, f"Too many insight jobs running (max {MAX_JOBS}); try again shortly",
+                is_error=True)
+        
+        # Long transcripts would otherwise block past the client's timeout
+        job_id = uuid.uuid4().hex
+        task = asyncio.get_running_loop().run_in_executor(
+            self._job_executor, extract_insights_from_conversation, conversation_text)
+        job = {"task": task, "finished": None}
+        self._jobs[job_id] = job
+        
+        def _finished(task):
+            job["finished"] = time.monotonic()
+            # Mark a failure as retrieved even if the job is never polled
+            if not task.cancelled():
+                task.exception()
+        
+        task.add_done_callback(_finished)
+        
+        return self._text_result(msg_id, json.dumps({"job_id": job_id, "status": "running"}))
+    
+    async def poll_job(self, msg_id, arguments):
+        """Report the status or result of an insight-detection job"""
+        self._expire_jobs()
+        
+        job_id = arguments.get("job_id", "")
+        job = self._jobs.get(job_id)
+        if job is None:
+            return self._text_result(msg_id, json.dumps({"job_id": job_id, "status": "unknown"}))
+        
+        task = job["task"]
+        if not task.done():
+            status = {"job_id": job_id, "status": "running"}
+        elif task.exception() is not None:
+            status = {"job_id": job_id, "status": "failed", "error": str(task.exception())}
+        else:
+            status = {"job_id": job_id, "status": "done", "result": task.result()}
+        
+        return self._text_result(msg_id, json.dumps(status))
+    
+    async def _process(self, line: bytes):
+        """Parse one JSON-RPC line, handle it and write the response"""
+        try:
+            line = line.strip()
+            if not line:
+                return
+            
+            logger.info(f"Received: {line.decode(errors='replace')}")
+            message = json_loads(line)
+            
+            static = None
+            if isinstance(message, dict):
+                static = self._static_results.get(message.get("method"))
+            
+            if static is not None:
+                response_json = (b'{"jsonrpc":"2.0","id":' + json_dumps(self._response_id(message))
+                                 + b',"result":' + static + b'}')
+            else:
+                response = await self.handle_message(message)
+                response_json = json_dumps(response)
+            
+            logger.info(f"Sending: {response_json.decode()}")
+            await self._out_q.put(response_json + b"\n")
+            
+        except json.JSONDecodeError as e:
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            logger.error(f"JSON decode error: {e}")
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+    
+    async def _stdout_writer(self):
+        """Write queued responses to stdout, flushing once per drained batch"""
+        out = sys.stdout.buffer
+        while True:
+            chunks = [await self._out_q.get()]
+            while not self._out_q.empty() and len(chunks) < WRITE_BATCH:
+                chunks.append(self._out_q.get_nowait())
+            
+            try:
+                out.write(b"".join(chunks))
+                out.flush()
+            except OSError as e:
+                # Client closed its end (e.g. BrokenPipeError); there is no
+                # one left to answer, so stop writing
+                logger.error(f"Error writing response: {e}")
+                return
+            finally:
+                for _ in chunks:
+                    self._out_q.task_done()
+    
+    async def _skip_line(self, reader, pending: int):
+        """Discard input up to and including the next newline
+        
+        Args:
+            reader: StreamReader positioned inside an oversize line
+            pending: Bytes already buffered that belong to that line
+        """
+        while True:
+            await reader.readexactly(pending)
+            try:
+                await reader.readuntil(b"\n")
+                return
+            except asyncio.IncompleteReadError:
+                return
+            except asyncio.LimitOverrunError as e:
+                pending = e.consumed
+    
+    async def _read_lines(self):
+        """Yield stdin lines; None stands for a line longer than MAX_MSG"""
+        loop = asyncio.get_running_loop()
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+        
+        if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode):
+            reader = asyncio.StreamReader(limit=MAX_MSG)
+            protocol = asyncio.StreamReaderProtocol(reader)
+            await loop.connect_read_pipe(lambda: protocol, sys.stdin)
+            
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    # Last line without a newline, or b"" at EOF
+                    line = e.partial
+                except asyncio.LimitOverrunError as e:
+                    # Drop the rest of the oversize line before reporting it
+                    await self._skip_line(reader, e.consumed)
+                    yield None
+                    continue
+                if not line:
+                    return
+                yield line
+        
+        # Pipe transports refuse regular files (e.g. `< msgs.txt`), so read
+        # those on a single thread feeding a bounded queue
+        lines = asyncio.Queue(maxsize=MAX_INFLIGHT)
+        
+        def pump():
+            stdin = sys.stdin.buffer
+            while True:
+                try:
+                    line = stdin.readline(MAX_MSG + 1)
+                    if len(line) > MAX_MSG and not line.endswith(b"\n"):
+                        while line and not line.endswith(b"\n"):
+                            line = stdin.readline(MAX_MSG)
+                        line = None
+                except OSError as e:
+                    # Treat an unreadable stdin as EOF so run() can shut down
+                    logger.error(f"Error reading stdin: {e}")
+                    line = b""
+                asyncio.run_coroutine_threadsafe(lines.put(line), loop).result()
+                if line == b"":
+                    return
+        
+        threading.Thread(target=pump, name="stdin-reader", daemon=True).start()
+        while True:
+            line = await lines.get()
+            if line == b"":
+                return
+            yield line
+    
     async def run(self):
         """Run the MCP server"""
         logger.info("Starting simple MCP server...")
         
-        while True:
+        # Bound in-flight handlers; the read loop waits for a free slot before
+        # starting a task, so a burst backs up in the pipe instead of memory
+        self._inflight = asyncio.Semaphore(MAX_INFLIGHT)
+        # Responses go through a single writer so they never interleave
+        self._out_q = asyncio.Queue()
+        writer_task = asyncio.create_task(self._stdout_writer())
+        
+        health_task = asyncio.create_task(self._health_refresher())
+        tasks = set()
+        
+        async for line in self._read_lines():
             try:
-                line = await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
-                if not line:
-                    break
-                    
-                line = line.strip()
-                if not line:
+                if line is None:
+                    # Line exceeded MAX_MSG; reject it without parsing
+                    logger.error("Rejected message larger than %d bytes", MAX_MSG)
+                    await self._out_q.put(json_dumps({
+                        "jsonrpc": "2.0",
+                        "id": None,
+                        "error": {
+                            "code": -32600,
+                            "message": "Message too large"
+                        }
+                    }) + b"\n")
                     continue
-                    
-                logger.info(f"Received: {line}")
-                message = json.loads(line)
-                
-                response = await self.handle_message(message)
-                response_json = json.dumps(response)
                 
-                logger.info(f"Sending: {response_json}")
-                print(response_json, flush=True)
+                # Handle each message concurrently; keep a reference until done
+                await self._inflight.acquire()
+                task = asyncio.create_task(self._process(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: self._inflight.release())
                 
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {e}")
-                continue
             except Exception as e:
                 logger.error(f"Error in main loop: {e}")
                 continue
+        
+        # Let in-flight requests finish before shutting down
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # Wait for queued responses, unless the writer has already stopped
+        join_task = asyncio.create_task(self._out_q.join())
+        await asyncio.wait({join_task, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+        join_task.cancel()
+        writer_task.cancel()
+        health_task.cancel()
+        self._job_executor.shutdown(wait=False, cancel_futures=True)
 
 async def main():
     server = SimpleMemoryMCPServer()
     await server.run()
 
 if __name__ == "__main__":
+    # Use the libuv-based event loop when it is installed (not on Windows)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file